@@ -3,6 +3,13 @@ STOP_TOKENS = ["[stop]", "[/INST]", "[INST]", "[MSG]", "[/MSG]"]
 DEFAULT_RESPONSE_RATE = 0.05
 DEFAULT_COMMAND_PREFIX = "~"
 
+DISCORD_MESSAGE_LIMIT = 2000
+SEND_BUCKET_CAPACITY = 5 # messages
+SEND_BUCKET_REFILL_RATE = 1.0 # messages per second
+SEND_MAX_RETRIES = 3
+SEND_BACKOFF_BASE = 1.0 # seconds
+SEND_LATENCY_WINDOW = 200 # sends
+
 HELP_MESSAGE_HEADER = """# What's good?
 This is Lil Weirdo, a bot which talks back. There are many personalities defined within Lil Weirdo, known as its various "sickos". Each sicko is defined by an LLM model, a prompt template, and a unique memory recording scheme. Every message that is sent may be recorded into a sicko's memory. There are a couple of commands defined for your consumption pleasure:
 """
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import random
 import re
@@ -7,7 +8,7 @@ from typing import Awaitable, Callable, TypeAlias, Union, cast
 import discord
 import ollama  # type: ignore
 
-from . import consts, keeper, sicko, templater
+from . import consts, keeper, postprocess, sender, sicko, templater
 
 L = logging.getLogger(__name__)
 
@@ -41,8 +42,9 @@ _Type_CommandTree: TypeAlias = dict[str, Union[Command, "_Type_CommandTree"] ]
 class CommandTree:
     """Manages the command tree of a discord bot, including generating
     documentation, managing a command prefix, and routing commands."""
-    def __init__(self, prefix: str = "/"):
+    def __init__(self, prefix: str = "/", replier: sender.Sender | None = None):
         self.prefix: str = prefix
+        self.sender: sender.Sender = sender.Sender() if replier is None else replier
         self.cmds: _Type_CommandTree = {}
 
     def add(self, name: str, metavars: list[str], description: Callable[[], str] | str, command_func: _Type_CommandTreeCallback) -> _Type_CommandTreeCallback:
@@ -125,7 +127,7 @@ class CommandTree:
                 if arg not in drill:
                     # We've reached a branch node where we cannot follow the command any longer.
                     L.info(f"Drilled down and couldn't find specified subcommand {arg} from command {msg_arglist}, replying with help for command tree {drill}.")
-                    await message.reply(self.help(drill))
+                    await self.sender.reply(message, self.help(drill))
                     return True 
                 drill = drill[arg]
                 continue
@@ -141,13 +143,13 @@ class CommandTree:
         #   * or it's a branch of self.cmds, in which case a partial command was supplied
         if isinstance(drill, dict):
             L.info(f"Incomplete command '{content}' provided, replying with help for command tree {drill}")
-            await message.reply(self.help(drill))
+            await self.sender.reply(message, self.help(drill))
         elif isinstance(drill, Command):
             args_rest = " ".join(msg_arglist[idx:])
             L.info(f"Found command {msg_arglist}, passing it string argument '{args_rest}'")
             # Send the help message if the command fails.
             if not await drill.func(args_rest, message):
-                await message.reply(self.help(drill))
+                await self.sender.reply(message, self.help(drill))
         return True
         
 
@@ -157,12 +159,13 @@ class DiscordWeirdo(discord.Client):
         self.sickos: dict[str, sicko.Sicko] = {
             "weirdo": sicko.Sicko(ollamaclient, keeper.PeopleKeeper, templater.LIL_WEIRDO),
             "freak": sicko.Sicko(ollamaclient, keeper.ConvoKeeper, templater.LIL_FREAK),
-            "uwu": sicko.Sicko(ollamaclient, keeper.ConvoKeeper, templater.LIL_OWO_FREAK),
+            "uwu": sicko.Sicko(ollamaclient, keeper.ConvoKeeper, templater.LIL_OWO_FREAK, [postprocess.uwu]),
         }
         self.response_rate: float = consts.DEFAULT_RESPONSE_RATE
         self.current_sicko: str | None = None
         # self.tree = discord.app_commands.CommandTree(self)
-        self.ctree = CommandTree(consts.DEFAULT_COMMAND_PREFIX)
+        self.sender = sender.Sender()
+        self.ctree = CommandTree(consts.DEFAULT_COMMAND_PREFIX, self.sender)
         self._register_commands()
 
     async def respond_to_message(self, message: discord.Message) -> None: 
@@ -174,77 +177,89 @@ class DiscordWeirdo(discord.Client):
         else:
             responder = self.sickos[self.current_sicko]
         L.info(f"Responding! Current sicko is {self.current_sicko}, responding with {responder}...")
+        # the sender keeps typing from here until the reply is actually sent
         async with message.channel.typing():
             response = await responder.respond_to(message.author)
             L.info(f"Generated response: {response}")
-            try:
-                # uwu_response = uwuify.uwu(response, flags=uwuify.SMILEY | uwuify.YU | uwuify.STUTTER)
-                # TODO: the non-uwuified version has to be the one that we feed into its memory
-                uwu_response = response
-            except IndexError:
-                # sometimes the uwu library fails lol
-                uwu_response = response
-            sent_message = await message.reply(uwu_response)
+            # remember what we generated, not what the transforms made of it,
+            # and do it now so it lands before any messages that come in while
+            # the reply is being sent
             L.info("Ingesting message event from ourselves...")
-            responder.keeper.process_self_message(sent_message)
+            memory_keeper = responder.keeper
+            memory = memory_keeper.process_self_message(message, response, responder.selfnick)
+            transformed = await responder.postprocessor.run(response)
+            def remember(sent_messages: list[discord.Message], complete: bool) -> None:
+                if not sent_messages:
+                    L.info("Reply never got sent, forgetting it...")
+                    memory_keeper.forget(memory)
+                    return
+                memory.message = sent_messages[0]
+                if not complete:
+                    # the sent chunks are transformed text, which must never end
+                    # up in memory, so we keep remembering the whole raw reply
+                    L.warning(f"Only {len(sent_messages)} chunks of our reply got sent, remembering all of it anyway")
+            await self.sender.reply(message, transformed, remember)
 
     async def on_ready(self) -> None:
         L.info(f"Loaded that mean ass bot named {self.user}")
 
     async def cmd_help(self, args: str, message: discord.Message) -> bool:
-        await message.reply(self.ctree.help())
+        await self.sender.reply(message, self.ctree.help())
         return True
     async def cmd_changeprefix(self, args: str, message: discord.Message) -> bool:
         sargs = args.strip()
         self.ctree.prefix = sargs
-        await message.reply(f"Changed command prefix to `{sargs}`.")
+        await self.sender.reply(message, f"Changed command prefix to `{sargs}`.")
         return True
     async def cmd_amnesia(self, args: str, message: discord.Message) -> bool:
         L.info("Clearing memory...")
         for s in self.sickos.values():
             s.keeper = s.keeper.__class__()
-        await message.reply("Uhhh I forgor >:3")
+        await self.sender.reply(message, "Uhhh I forgor >:3")
         return True
     async def cmd_responserate(self, args: str, message: discord.Message) -> bool:
         try:
             rate = float(re.split(r"\s+", args)[0])
             assert 0 <= rate <= 1
             self.response_rate = rate
-            await message.reply(f"Set response rate to {rate}")
+            await self.sender.reply(message, f"Set response rate to {rate}")
         except (IndexError, ValueError, AssertionError):
             return False
         return True
     def __sicko_list(self) -> str:
         return ", ".join([f"`{sicko}`" for sicko in self.sickos.keys()]) 
     async def cmd_sicko_list(self, args: str, message: discord.Message) -> bool:
-        await message.reply(f"Currently available sickos: {self.__sicko_list()}")
+        await self.sender.reply(message, f"Currently available sickos: {self.__sicko_list()}")
         return True
     async def cmd_sicko_current(self, args: str, message: discord.Message) -> bool:
         if self.current_sicko is None:
-            await message.reply("Currently set to shuffle all sickos each reply.")
+            await self.sender.reply(message, "Currently set to shuffle all sickos each reply.")
         else:
-            await message.reply(f"The sicko that's replying to you is `{self.current_sicko}`.")
+            await self.sender.reply(message, f"The sicko that's replying to you is `{self.current_sicko}`.")
         return True
     async def cmd_sicko_shuffle(self, args: str, message: discord.Message) -> bool:
         self.current_sicko = None
-        await message.reply("Shuffling sickos.")
+        await self.sender.reply(message, "Shuffling sickos.")
         return True
     async def cmd_sicko_set(self, args: str, message: discord.Message) -> bool:
         newsicko = re.split(r"\s+", args)[0]
         if newsicko not in self.sickos.keys():
-            await message.reply(f"Sicko `{newsicko}` not available.\nCurrently available sickos: {self.__sicko_list()}")
+            await self.sender.reply(message, f"Sicko `{newsicko}` not available.\nCurrently available sickos: {self.__sicko_list()}")
             return True
         self.current_sicko = newsicko
-        await message.reply(f"Switched to `{newsicko}`.")
+        await self.sender.reply(message, f"Switched to `{newsicko}`.")
         return True
     async def cmd_cheevosfrom(self, args: str, message: discord.Message) -> bool:
         sargs = args.strip()
         if len(sargs) == 0:
             return False
-        response = templater.CHEEVOS_FROM.generate(sargs)
-        await message.reply(f"""Achievements from {sargs}: 
+        response = await asyncio.to_thread(templater.CHEEVOS_FROM.generate, sargs)
+        await self.sender.reply(message, f"""Achievements from {sargs}: 
 {response}""")
         return True
+    async def cmd_sendstats(self, args: str, message: discord.Message) -> bool:
+        await self.sender.reply(message, self.sender.summary())
+        return True
     def _register_commands(self) -> None:
         """Registers all command functions with our [[self.ctree]]."""
         self.ctree.add("help", [], "Show this help message.", self.cmd_help)
@@ -259,7 +274,8 @@ class DiscordWeirdo(discord.Client):
                        lambda: f"Lists the currently replying sicko. It is currently `{self.current_sicko}`", self.cmd_sicko_current) 
         self.ctree.add("sicko shuffle", [], "Sets the sickos to shuffle which one responds to a given message", self.cmd_sicko_shuffle) 
         self.ctree.add("sicko set", ["name"], "Sets the currently responding sicko to the given named sicko", self.cmd_sicko_set) 
-        self.ctree.add("cheevosfrom", ["game title"], "What's the list of achievements from your favorite game?", self.cmd_sicko_set) 
+        self.ctree.add("cheevosfrom", ["game title"], "What's the list of achievements from your favorite game?", self.cmd_cheevosfrom)
+        self.ctree.add("sendstats", [], "Shows how quickly messages are getting sent.", self.cmd_sendstats)
 
     async def on_message(self, message: discord.Message) -> None:
         if message.author.id == self.user.id: # type: ignore
@@ -1,6 +1,7 @@
 import logging
 from abc import ABC, abstractmethod
 from collections import defaultdict, deque
+from dataclasses import dataclass
 from itertools import islice
 
 import discord
@@ -10,6 +11,15 @@ L = logging.getLogger(__name__)
 def user_nick(msg: discord.Message) -> str:
     return msg.author.global_name or msg.author.name
 
+@dataclass(eq=False)
+class Memory:
+    """A remembered message, along with who the AI should see saying it and
+    what they said. Our own replies are remembered before they're delivered,
+    so `message` is None until then."""
+    nick: str
+    content: str
+    message: discord.Message | None = None
+
 class Keeper(ABC):
     MESSAGE_HISTORY_LEN = 0
 
@@ -18,8 +28,14 @@ class Keeper(ABC):
         """Ingest a user's message."""
         pass
     @abstractmethod
-    def process_self_message(self, message: discord.Message) -> None:
-        """Ingest our own message so we can remember what we said."""
+    def process_self_message(self, replied_to: discord.Message, content: str, nick: str) -> Memory:
+        """Ingest our own reply as soon as we've generated it, so it lands in
+        conversation order. Returns the memory so it can be filled in once the
+        reply is delivered, or forgotten if it never is."""
+        pass
+    @abstractmethod
+    def forget(self, memory: Memory) -> None:
+        """Drop a memory, if we still have it."""
         pass
     @abstractmethod
     def get_recent(self, message_count: int, member_id: int) -> list[discord.Message]: 
@@ -49,19 +65,27 @@ class ConvoKeeper(Keeper):
         Attributes:
             history -- the last MESSAGE_HISTORY_LEN messages
         """
-        self.history: deque[discord.Message] = deque(maxlen=self.MESSAGE_HISTORY_LEN)
+        self.history: deque[Memory] = deque(maxlen=self.MESSAGE_HISTORY_LEN)
 
     def process_message(self, message: discord.Message) -> None:
         """Ingest a user's message."""
-        self.history.append(message)
+        self.history.append(Memory(user_nick(message), message.clean_content, message))
+
+    def process_self_message(self, replied_to: discord.Message, content: str, nick: str) -> Memory:
+        """Ingest our own reply so we can remember what we said."""
+        memory = Memory(nick, content)
+        self.history.append(memory)
+        return memory
 
-    def process_self_message(self, message: discord.Message) -> None:
-        """Ingest our own message so we can remember what we said."""
-        self.history.append(message)
+    def forget(self, memory: Memory) -> None:
+        """Drop a memory, if we still have it."""
+        if memory in self.history:
+            self.history.remove(memory)
 
     def get_recent(self, message_count: int, member_id: int) -> list[discord.Message]: 
         """Gets the last N known messages."""
-        return list(islice(reversed(self.history), message_count))
+        recent = islice(reversed(self.history), message_count)
+        return [mem.message for mem in recent if mem.message is not None]
     
     def get_count(self, member_id: int = 0) -> int: 
         """Gets a known message count."""
@@ -72,7 +96,7 @@ class ConvoKeeper(Keeper):
         Produces a user's message history in a format that the AI can
         understand. The newest message will always be last.
         """
-        return [f"{start_token} {user_nick(msg)}: {msg.clean_content} {stop_token}" for msg in self.history]
+        return [f"{start_token} {mem.nick}: {mem.content} {stop_token}" for mem in self.history]
 
 
 class PeopleKeeper(Keeper):
@@ -86,23 +110,29 @@ class PeopleKeeper(Keeper):
         Attributes:
             history -- maps user IDs to a history of messages
         """
-        self.history: dict[int, deque[discord.Message]] = \
+        self.history: dict[int, deque[Memory]] = \
             defaultdict(lambda: deque(maxlen=self.MESSAGE_HISTORY_LEN))
 
     def process_message(self, message: discord.Message) -> None:
         """Ingest a user's message."""
-        self.history[message.author.id].append(message)
+        self.history[message.author.id].append(Memory(user_nick(message), message.clean_content, message))
         
-    def process_self_message(self, message: discord.Message) -> None:
-        """Ingest our own message so we can remember what we said."""
-        if message.reference:
-            if isinstance(message.reference.resolved, discord.Message):
-                who_we_replied_to = message.reference.resolved.author.id 
-                self.history[who_we_replied_to].append(message)
+    def process_self_message(self, replied_to: discord.Message, content: str, nick: str) -> Memory:
+        """Ingest our own reply so we can remember what we said."""
+        memory = Memory(nick, content)
+        self.history[replied_to.author.id].append(memory)
+        return memory
+
+    def forget(self, memory: Memory) -> None:
+        """Drop a memory, if we still have it."""
+        for history in self.history.values():
+            if memory in history:
+                history.remove(memory)
 
     def get_recent(self, message_count: int, member_id: int) -> list[discord.Message]: 
         """Gets a user's last N known messages."""
-        return list(islice(reversed(self.history[member_id]), message_count))
+        recent = islice(reversed(self.history[member_id]), message_count)
+        return [mem.message for mem in recent if mem.message is not None]
     
     def get_count(self, member_id: int) -> int: 
         """Gets a user's known message count."""
@@ -113,4 +143,4 @@ class PeopleKeeper(Keeper):
         Produces a user's message history in a format that the AI can
         understand. The newest message will always be last.
         """
-        return [f"{start_token} {user_nick(msg)}: {msg.clean_content} {stop_token}" for msg in self.history[member_id]]
+        return [f"{start_token} {mem.nick}: {mem.content} {stop_token}" for mem in self.history[member_id]]
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import re
+from typing import Callable, Iterable, cast
+
+import uwuify  # type: ignore
+
+from . import consts as c
+
+L = logging.getLogger(__name__)
+
+Transform = Callable[[str], str]
+
+# bounds the whitespace a speaker marker may contain, so we know how far back a
+# match could start when new text comes in
+_MAX_GAP = 4
+
+
+class StopScanner:
+    """Scans generated text for the point where the AI stops talking as itself.
+    That is either one of the stop tokens, or a line where somebody else in
+    the conversation starts speaking, like `[MSG] nick:` or just `nick:`. Text
+    can be fed in as it streams, and only the tail that could still complete a
+    match is rescanned.
+
+    Args:
+        stoptokens: Strings which end the generation wherever they appear.
+        speakers: The nicks of everybody the AI might start pretending to be.
+        starttok: The token that starts a message in the prompt.
+    """
+    def __init__(self,
+                 stoptokens: Iterable[str] = c.STOP_TOKENS,
+                 speakers: Iterable[str] = (),
+                 starttok: str = "[MSG]"):
+        stoptokens = sorted(set(stoptokens), key=len, reverse=True)
+        speakers = sorted(set(speakers), key=len, reverse=True)
+        alternatives = [re.escape(st) for st in stoptokens]
+        self.holdback: int = max((len(st) for st in stoptokens), default=0)
+        if speakers:
+            gap = f"[ \\t]{{0,{_MAX_GAP}}}"
+            nicks = "|".join(re.escape(s) for s in speakers)
+            alternatives.append(f"\\n{gap}(?:{re.escape(starttok)}{gap})?(?:{nicks}){gap}:")
+            self.holdback = max(self.holdback, 1 + len(starttok) + len(speakers[0]) + 1 + 3 * _MAX_GAP)
+        self.pattern: re.Pattern[str] | None = re.compile("|".join(alternatives)) if alternatives else None
+        self.buffer: str = ""
+        self.stop: int | None = None
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop is not None
+
+    @property
+    def text(self) -> str:
+        """Everything fed in so far, cropped before the stop if one was hit."""
+        return self.buffer[:self.stop].rstrip()
+
+    def feed(self, chunk: str) -> bool:
+        """Adds a chunk of generated text. Returns True once a stop has been
+        found, after which further chunks are ignored."""
+        if self.stopped:
+            return True
+        # any match we haven't seen yet has to end inside the new chunk
+        start = max(0, len(self.buffer) - self.holdback + 1)
+        self.buffer += chunk
+        if self.pattern is not None:
+            match = self.pattern.search(self.buffer, start)
+            if match is not None:
+                L.info(f"Found stop {match.group()!r}, cropping generation")
+                self.stop = match.start()
+        return self.stopped
+
+
+class Pipeline:
+    """Runs a response through a series of text transforms before it gets sent.
+    Each transform runs in a worker thread so slow ones don't stall the bot.
+    A transform that raises is skipped.
+
+    Args:
+        transforms: Functions from text to text, applied in order.
+    """
+    def __init__(self, transforms: Iterable[Transform] = ()):
+        self.transforms: list[Transform] = list(transforms)
+
+    async def run(self, text: str) -> str:
+        for transform in self.transforms:
+            try:
+                text = await asyncio.to_thread(transform, text)
+            except Exception:
+                L.exception(f"Transform {transform} failed, skipping it")
+        return text
+
+
+def uwu(text: str) -> str:
+    return cast(str, uwuify.uwu(text, flags=uwuify.SMILEY | uwuify.YU | uwuify.STUTTER))
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import re
+import statistics
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import aiohttp
+import discord
+
+from . import consts as c
+
+L = logging.getLogger(__name__)
+
+_Type_SentCallback = Callable[[list[discord.Message], bool], None]
+
+SPLIT_SEPARATORS = ["\n\n", "\n", " "]
+FENCE = "```"
+FENCE_PATTERN = re.compile(r"^[ \t]*```(\S*)", re.MULTILINE)
+CLOSER_PATTERN = re.compile(r"(?:[ \t]*\n)*[ \t]*```[ \t]*(?:\n|\Z)")
+
+
+def _open_fence(chunk: str) -> str | None:
+    """Follows the code fences through a chunk, returning the language of the
+    one left open at the end, if any."""
+    lang: str | None = None
+    for match in FENCE_PATTERN.finditer(chunk):
+        lang = match.group(1) if lang is None else None
+    return lang
+
+
+def _is_blank(chunk: str) -> bool:
+    """Whether a chunk has nothing in it but whitespace and code fences."""
+    return not FENCE_PATTERN.sub("", chunk).strip()
+
+
+def split_message(content: str, limit: int = c.DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """Splits a message into chunks that Discord will accept. Prefers to cut
+    between paragraphs, then between lines, then between words, and only cuts
+    mid-word if a single word is longer than the limit. Only the separator
+    that was cut on is dropped, so indentation survives. A code block that
+    gets cut is closed at the end of one chunk and reopened at the start of
+    the next. Chunks with nothing but whitespace and fences in them are
+    skipped, so a blank message splits into nothing."""
+    chunks: list[str] = []
+    # drop leading blank lines, but not the first line's indentation
+    rest = re.sub(r"\A\s*\n", "", content.rstrip())
+    while len(rest) > limit:
+        # leave room to close a code block we might cut through
+        window = rest[:limit - len(FENCE) - 1]
+        # cutting right after a leading fence would leave an empty code block
+        opener = FENCE_PATTERN.match(window)
+        floor = 0 if opener is None else opener.end()
+        for sep in SPLIT_SEPARATORS:
+            cut = window.rfind(sep)
+            if cut > floor:
+                break
+        else:
+            sep, cut = "", len(window)
+        chunk = rest[:cut]
+        rest = rest[cut + len(sep):]
+        lang = _open_fence(chunk)
+        if lang is not None:
+            opener = list(FENCE_PATTERN.finditer(chunk))[-1]
+            closer = CLOSER_PATTERN.match(rest)
+            if _is_blank(chunk[opener.start():]):
+                # the block only just opened, so start it in the next chunk
+                chunk = chunk[:opener.start()]
+                rest = f"{FENCE}{lang}\n{rest}"
+            elif closer is not None:
+                # the block was about to close anyway, so close it here instead
+                chunk += f"\n{FENCE}"
+                rest = rest[closer.end():]
+            else:
+                chunk += f"\n{FENCE}"
+                rest = f"{FENCE}{lang}\n{rest}"
+        if not _is_blank(chunk):
+            chunks.append(chunk)
+    if not _is_blank(rest):
+        chunks.append(rest)
+    return chunks
+
+
+class TokenBucket:
+    """A token bucket rate limiter. Holds up to `capacity` tokens, refilling
+    at `refill_rate` tokens per second, and every send costs one token.
+
+    Args:
+        capacity: How many sends may happen in a burst.
+        refill_rate: How many sends per second are allowed in the long run.
+    """
+    def __init__(self,
+                 capacity: int = c.SEND_BUCKET_CAPACITY,
+                 refill_rate: float = c.SEND_BUCKET_REFILL_RATE):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Waits until a token is available, then takes it."""
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.refill_rate)
+            self._refill()
+        self.tokens -= 1
+
+
+@dataclass
+class _SendJob:
+    """A reply waiting in a channel's queue."""
+    message: discord.Message
+    chunks: list[str]
+    on_sent: Optional[_Type_SentCallback]
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class Sender:
+    """Delivers replies to Discord without making the caller wait on them.
+    Every channel gets its own queue, drained in order by a single worker task
+    which respects that channel's [[TokenBucket]] and shows the bot as typing
+    until each reply lands. Long messages are split with
+    [[split_message]], and sends that hit rate limits or fail to connect are
+    retried with exponential backoff.
+
+    Args:
+        max_retries: How many times to retry a chunk before giving up on the
+            rest of the reply.
+        backoff_base: How long to wait before the first retry, in seconds.
+            Doubles with every retry.
+    """
+    def __init__(self,
+                 max_retries: int = c.SEND_MAX_RETRIES,
+                 backoff_base: float = c.SEND_BACKOFF_BASE):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.buckets: dict[int, TokenBucket] = {}
+        self.queues: dict[int, deque[_SendJob]] = {}
+        self.workers: dict[int, asyncio.Task[None]] = {}
+        self.latencies: deque[float] = deque(maxlen=c.SEND_LATENCY_WINDOW)
+        self.sent_count = 0
+        self.retry_count = 0
+        self.failure_count = 0
+
+    async def reply(self, message: discord.Message, content: str, on_sent: Optional[_Type_SentCallback] = None) -> None:
+        """Queues a reply to a message and returns immediately.
+
+        Arguments:
+            message: The message to reply to.
+
+            content: The reply, which may be longer than Discord allows.
+
+            on_sent: Called once we're done with this reply, with every message
+            that was sent for it and whether that was all of them. Called even
+            if nothing could be sent."""
+        chunks = split_message(content)
+        if not chunks:
+            L.warning(f"Dropping blank reply to message {message.id}")
+            if on_sent is not None:
+                on_sent([], False)
+            return
+        channel_id = message.channel.id
+        self.queues.setdefault(channel_id, deque()).append(_SendJob(message, chunks, on_sent))
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _drain(self, channel_id: int) -> None:
+        """Delivers a channel's queued replies in order, then retires."""
+        queue = self.queues[channel_id]
+        bucket = self.buckets.setdefault(channel_id, TokenBucket())
+        try:
+            while queue:
+                job = queue.popleft()
+                sent: list[discord.Message] = []
+                try:
+                    async with AsyncExitStack() as stack:
+                        # keep typing while the reply waits on the bucket or backoff
+                        try:
+                            await stack.enter_async_context(job.message.channel.typing())
+                        except discord.HTTPException as e:
+                            L.warning(f"Couldn't show typing in channel {channel_id}: {e}")
+                        for chunk in job.chunks:
+                            sent_message = await self._send(job.message, chunk, bucket)
+                            if sent_message is None:
+                                break
+                            sent.append(sent_message)
+                            self.latencies.append(time.monotonic() - job.enqueued)
+                except Exception:
+                    L.exception(f"Failed to send reply to message {job.message.id}, moving on")
+                    self.failure_count += 1
+                if job.on_sent is not None:
+                    try:
+                        job.on_sent(sent, len(sent) == len(job.chunks))
+                    except Exception:
+                        L.exception(f"Callback for reply to message {job.message.id} failed")
+        finally:
+            # there's no await between seeing an empty queue and retiring, so
+            # nothing can be enqueued to this channel in the meantime
+            del self.workers[channel_id]
+            del self.queues[channel_id]
+
+    async def _send(self, message: discord.Message, chunk: str, bucket: TokenBucket) -> discord.Message | None:
+        """Sends a single chunk. Returns None if the chunk couldn't be sent.
+
+        discord.py already retries rate limits and server errors on its own, so
+        we only retry what it gives up on: a 429 that outlasted its retries, or
+        failing to connect at all. Server errors, dropped connections and
+        timeouts aren't retried, since the message may have been posted anyway
+        and we'd send it twice."""
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                sent_message = await message.reply(chunk)
+                self.sent_count += 1
+                return sent_message
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    L.error(f"Failed to send reply to message {message.id} after {attempt + 1} attempts: {e}")
+                    self.failure_count += 1
+                    return None
+                reason = f"status {e.status}"
+            except aiohttp.ClientConnectorError as e:
+                if attempt == self.max_retries:
+                    L.error(f"Failed to send reply to message {message.id} after {attempt + 1} attempts: {e!r}")
+                    self.failure_count += 1
+                    return None
+                reason = repr(e)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                L.error(f"Failed to send reply to message {message.id}, it may or may not have been posted: {e!r}")
+                self.failure_count += 1
+                return None
+            delay = self.backoff_base * 2 ** attempt
+            L.warning(f"Send to channel {message.channel.id} failed with {reason}, retrying in {delay}s")
+            self.retry_count += 1
+            await asyncio.sleep(delay)
+        return None
+
+    def summary(self) -> str:
+        """Describes recent send latencies, measured from when a reply was
+        queued to when each of its messages landed."""
+        if not self.latencies:
+            return f"No messages sent yet. {self.failure_count} failures."
+        lats = sorted(self.latencies)
+        p95 = lats[min(len(lats) - 1, int(len(lats) * 0.95))]
+        return (f"Sent {self.sent_count} messages with {self.retry_count} retries and {self.failure_count} failures. "
+                f"Over the last {len(lats)} sends, latency was {statistics.median(lats):.2f}s median, "
+                f"{p95:.2f}s p95, {lats[-1]:.2f}s max.")
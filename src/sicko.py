@@ -1,10 +1,12 @@
+import asyncio
 import logging
-from typing import Type
+from typing import Generator, Iterable, Type, cast
 
 import discord
 import ollama as ol  # type: ignore
 
-from .keeper import ConvoKeeper, Keeper
+from .keeper import ConvoKeeper, Keeper, user_nick
+from .postprocess import Pipeline, StopScanner, Transform
 from .templater import LIL_WEIRDO, Templater
 
 L = logging.getLogger(__name__)
@@ -17,36 +19,60 @@ class Sicko:
         keeper: A Keeper class to initialize, serving as the memory of the AI.
         templater: A Templater, which controls the prompt template, stop 
             tokens, choice of model, and other options.
+        transforms: Text transforms applied to responses before they're sent,
+            but not before they're remembered.
     """
     def __init__(self,
                  ollamaclient: ol.Client = None,
                  keeper: Type[Keeper] = ConvoKeeper, 
-                 templater: Templater = LIL_WEIRDO):
+                 templater: Templater = LIL_WEIRDO,
+                 transforms: Iterable[Transform] = ()):
         L.info("Initializing LC chain...")
         L.info(f"Memory keeper: {keeper}")
         L.info(f"Templater: {templater}")
         self.llm: ol.Client = ol.Client() if ollamaclient is None else ollamaclient
         self.templater: Templater = templater
         self.keeper: Keeper = keeper()
+        self.postprocessor: Pipeline = Pipeline(transforms)
         self.starttok = "[MSG]"
         self.stoptok = "[/MSG]"
+        self.selfnick = "Lil Weirdo"
         L.info("LC chain initialized! Asking it how it feels to be alive...")
-        L.info(self.__generate(f"{self.starttok} God: How does it feel to be alive? {self.stoptok}\n{self.starttok} Lil Weirdo:"))
+        L.info(self.__generate(f"{self.starttok} God: How does it feel to be alive? {self.stoptok}\n{self.starttok} {self.selfnick}:",
+                               self.__scanner(["God"])))
 
     def __prompt(self, user: discord.Member | discord.User) -> str:
         messages = '\n'.join(self.keeper.get_ai_ingestible(user.id, self.starttok, self.stoptok))
-        prompt = f"{messages}\n{self.starttok} Lil Weirdo:"
+        prompt = f"{messages}\n{self.starttok} {self.selfnick}:"
         L.info(f"Generated prompt: {prompt}")
         return prompt
 
-    def __generate(self, prompt: str) -> str:
+    def __scanner(self, speakers: Iterable[str]) -> StopScanner:
+        return StopScanner(self.templater.stoptokens, [*speakers, self.selfnick], self.starttok)
+
+    def __speakers(self, user: discord.Member | discord.User) -> set[str]:
+        """Everybody in the conversation the AI is about to continue."""
+        recent = self.keeper.get_recent(self.keeper.MESSAGE_HISTORY_LEN, user.id)
+        return {user_nick(msg) for msg in recent}
+
+    def __generate(self, prompt: str, scanner: StopScanner) -> str:
+        """Streams a completion through the scanner, hanging up on Ollama as
+        soon as a stop is found."""
         with self.templater.with_model(self.llm) as modelname:
-            response: str = self.llm.generate(
+            # ollama hands back a generator, closing it hangs up the request
+            stream = cast("Generator[ol.GenerateResponse, None, None]", self.llm.generate(
                 model=modelname,
-                prompt=prompt
-            )['response']
-            L.info(f"Generated response: {response}")
-            return response
+                prompt=prompt,
+                stream=True
+            ))
+            try:
+                for part in stream:
+                    if scanner.feed(part['response']):
+                        break
+            finally:
+                stream.close()
+            L.info(f"Generated response: {scanner.text}")
+            return scanner.text
 
     async def respond_to(self, user: discord.Member | discord.User) -> str: 
         """Generates a mean message. Expects the most recent message to be last
@@ -56,4 +82,5 @@ class Sicko:
         
         Args:
             user is the person that invoked the AI"""
-        return self.__generate(self.__prompt(user))
+        scanner = self.__scanner(self.__speakers(user))
+        return await asyncio.to_thread(self.__generate, self.__prompt(user), scanner)